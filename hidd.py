@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Shared Raw HID broker for Work Louder Micro.
+
+macOS gives one process exclusive access to the keyboard, so vial_kbd.py
+and led_ui.py normally can't run together. hidd owns the device and both
+clients talk to it over a Unix socket instead; when the socket is absent
+they fall back to opening the device themselves.
+
+Wire format (both directions): [length byte][payload]
+  client → hidd:  one Raw HID command (≤ 32 bytes), or an empty frame to
+                  subscribe to key events
+  hidd → client:  the 32-byte reply to each command (empty if the keyboard
+                  didn't answer), plus 0xEE key events for subscribers and
+                  [0xEF, cmd] to the other subscribers after a client runs cmd
+
+Commands from all clients go through one bounded queue and are run against
+the device one at a time by a command thread; the main thread blocks reading
+the device and routes each report to subscribers or to that thread.
+
+hidd owns direct mode: it enters it once at start and restores the normal
+effect on exit. Enter-direct-mode (which would wipe every client's LEDs) and
+restore commands from clients are acked without reaching the keyboard.
+"""
+
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import time
+
+try:
+    import hid
+except ImportError:
+    print("Missing 'hidapi' package. Install with: pip install hidapi")
+    sys.exit(1)
+
+SOCKET_PATH = "/tmp/claude-kbd.sock"
+
+WL_VID = 0x574C
+WL_PID = 0xE6E3
+RAW_HID_USAGE_PAGE = 0xFF60
+RAW_HID_USAGE = 0x61
+MSG_LEN = 32
+
+CMD_RESTORE = 0x03
+CMD_ENTER_DIRECT = 0x05
+CMD_KEY_EVENT = 0xEE
+CMD_CHANGED = 0xEF  # hidd → subscriber: another client ran this command
+CMD_PING = 0xF0
+
+QUEUE_LEN = 64        # commands waiting for the device
+REPLY_TIMEOUT = 0.5   # seconds to wait for a command's reply
+IDLE_READ_MS = 250    # read timeout; only bounds how long Ctrl+C/SIGTERM waits
+SEND_TIMEOUT = 1.0    # seconds a client may leave its socket full before it's dropped
+
+
+# === Client side ===
+
+class HiddClient:
+    """Stand-in for an open hid.device that forwards to a running hidd.
+
+    Implements the write/read/close subset the daemon and LED UI use, plus
+    fileno() so the daemon can select() on incoming key events.
+    Raises OSError on construction if hidd isn't running.
+    """
+
+    def __init__(self, subscribe_keys=False):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(SOCKET_PATH)
+            if subscribe_keys:
+                self.sock.sendall(b"\x00")
+        except OSError:
+            self.sock.close()
+            raise
+        self._buf = bytearray()
+
+    def write(self, data):
+        msg = bytes(data[1:1 + MSG_LEN])  # drop the report ID byte
+        self.sock.settimeout(None)  # read() may have left the socket non-blocking
+        self.sock.sendall(bytes([len(msg)]) + msg)
+        return len(data)
+
+    def read(self, max_length, timeout_ms=0):
+        deadline = time.monotonic() + timeout_ms / 1000
+        while True:
+            if self._buf and len(self._buf) > self._buf[0]:
+                n = self._buf[0]
+                frame = bytes(self._buf[1:1 + n])
+                del self._buf[:1 + n]
+                if frame:
+                    return list(frame[:max_length])
+                continue  # the keyboard didn't answer that command
+            # A zero timeout still drains whatever hidd has already sent
+            self.sock.settimeout(max(0, deadline - time.monotonic()))
+            try:
+                chunk = self.sock.recv(4096)
+            except (socket.timeout, BlockingIOError):
+                return []
+            if not chunk:
+                raise OSError("hidd closed the connection")
+            self._buf += chunk
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+
+# === Broker ===
+
+requests = queue.Queue(maxsize=QUEUE_LEN)  # (conn, msg)
+subscribers = set()
+subscribers_lock = threading.Lock()
+send_locks = {}  # conn → lock, so a reply and a key event can't interleave
+
+
+def connect():
+    for desc in hid.enumerate(WL_VID, WL_PID):
+        if desc["usage_page"] == RAW_HID_USAGE_PAGE and desc["usage"] == RAW_HID_USAGE:
+            dev = hid.device()
+            try:
+                dev.open_path(desc["path"])
+            except OSError:
+                continue
+            return dev
+    return None
+
+
+def send_frame(conn, data):
+    lock = send_locks.get(conn)
+    if lock is None:
+        return  # client already gone
+    with lock:
+        try:
+            conn.sendall(bytes([len(data)]) + data)
+        except socket.timeout:
+            # It stopped reading, and a partial frame has desynced its stream.
+            # Hang up rather than stall every other client behind it.
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        except OSError:
+            pass  # client went away; its reader thread cleans up
+
+
+def recv_exact(conn, n):
+    buf = b""
+    while len(buf) < n:
+        try:
+            chunk = conn.recv(n - len(buf))
+        except socket.timeout:
+            continue  # SEND_TIMEOUT applies to reads too; an idle client is fine
+        if not chunk:
+            return None
+        buf += chunk
+    return buf
+
+
+def serve_client(conn):
+    """Queue every command frame a client sends until it disconnects."""
+    conn.settimeout(SEND_TIMEOUT)
+    send_locks[conn] = threading.Lock()
+    try:
+        while True:
+            hdr = recv_exact(conn, 1)
+            if hdr is None:
+                break
+            if hdr[0] == 0:
+                with subscribers_lock:
+                    subscribers.add(conn)
+                continue
+            msg = recv_exact(conn, hdr[0])
+            if msg is None:
+                break
+            requests.put((conn, msg[:MSG_LEN]))
+    except OSError:
+        pass
+    finally:
+        with subscribers_lock:
+            subscribers.discard(conn)
+        send_locks.pop(conn, None)
+        conn.close()
+
+
+def accept_loop(server):
+    while True:
+        try:
+            conn, _ = server.accept()
+        except OSError:
+            return
+        threading.Thread(target=serve_client, args=(conn,), daemon=True).start()
+
+
+def dispatch_report(report):
+    """Forward an unsolicited report; returns True if it was a key event."""
+    if report[0] != CMD_KEY_EVENT:
+        return False
+    with subscribers_lock:
+        targets = list(subscribers)
+    for conn in targets:
+        send_frame(conn, report)
+    return True
+
+
+def notify_others(sender, cmd):
+    """Tell every subscriber but `sender` that `cmd` may have changed its LEDs."""
+    with subscribers_lock:
+        targets = [conn for conn in subscribers if conn is not sender]
+    for conn in targets:
+        send_frame(conn, bytes([CMD_CHANGED, cmd]))
+
+
+def run_now(dev, msg):
+    """Run one command before or after the worker threads; returns its reply or b""."""
+    dev.write(b"\x00" + msg.ljust(MSG_LEN, b"\x00"))
+    deadline = time.monotonic() + REPLY_TIMEOUT
+    while time.monotonic() < deadline:
+        remaining = max(1, int((deadline - time.monotonic()) * 1000))
+        data = dev.read(MSG_LEN, timeout_ms=remaining)
+        if data and data[0] == msg[0]:
+            return bytes(data)
+    return b""
+
+
+def command_loop(dev, replies, acks):
+    """Run queued commands one at a time, matching each to its reply.
+
+    Commands in `acks` are answered from it instead of reaching the device.
+    """
+    buf = bytearray(MSG_LEN + 1)
+    while True:
+        conn, msg = requests.get()  # sleeps until a client sends something
+        if msg[0] in acks:
+            send_frame(conn, acks[msg[0]])
+            continue
+        while not replies.empty():
+            replies.get_nowait()  # late replies to commands that timed out
+        buf[1:] = msg.ljust(MSG_LEN, b"\x00")
+        reply = b""
+        try:
+            dev.write(bytes(buf))
+        except OSError:
+            pass  # disconnected; device_loop's read notices and exits
+        else:
+            deadline = time.monotonic() + REPLY_TIMEOUT
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    report = replies.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if report[0] == msg[0]:
+                    reply = report
+                    break
+        send_frame(conn, reply)
+        if msg[0] != CMD_PING:
+            notify_others(conn, msg[0])
+
+
+def device_loop(dev, acks):
+    """Sole owner of the device: forward key events, hand replies to command_loop.
+
+    Commands are written from their own thread as soon as they're queued, so
+    this loop can sit in a long blocking read instead of polling.
+    """
+    replies = queue.Queue()
+    threading.Thread(target=command_loop, args=(dev, replies, acks), daemon=True).start()
+    while True:
+        data = dev.read(MSG_LEN, timeout_ms=IDLE_READ_MS)
+        if data:
+            report = bytes(data)
+            if not dispatch_report(report):
+                replies.put(report)
+
+
+def main():
+    # Refuse to start twice; clear a socket left behind by a crashed broker
+    try:
+        HiddClient().close()
+        print(f"hidd is already running ({SOCKET_PATH}).")
+        sys.exit(1)
+    except OSError:
+        pass
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+
+    dev = connect()
+    if not dev:
+        print("Could not connect to keyboard.")
+        print("Make sure vial_kbd.py and led_ui.py are not running.")
+        sys.exit(1)
+    direct_ack = run_now(dev, bytes([CMD_ENTER_DIRECT]))
+    if not direct_ack:
+        print("Keyboard didn't answer; is it running the Raw HID firmware?")
+        dev.close()
+        sys.exit(1)
+    acks = {
+        CMD_ENTER_DIRECT: direct_ack,
+        CMD_RESTORE: bytes([CMD_RESTORE, 0x01]).ljust(MSG_LEN, b"\x00"),
+    }
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(SOCKET_PATH)
+    os.chmod(SOCKET_PATH, 0o600)  # only our user may drive the keyboard
+    server.listen()
+    threading.Thread(target=accept_loop, args=(server,), daemon=True).start()
+
+    signal.signal(signal.SIGTERM, lambda sig, frame: sys.exit(0))
+    print(f"hidd → {SOCKET_PATH}")
+    print("Ctrl+C to quit\n")
+
+    try:
+        device_loop(dev, acks)
+    except OSError:
+        print("Keyboard disconnected.")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        os.unlink(SOCKET_PATH)
+        try:
+            run_now(dev, bytes([CMD_RESTORE]))  # hand the LEDs back to the normal effect
+        except OSError:
+            pass
+        dev.close()
+        print("\nBye.")
+
+
+if __name__ == "__main__":
+    main()
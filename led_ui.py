@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 """Web UI for controlling Work Louder Micro LEDs over Raw HID."""
 
+import hashlib
 import json
+import os
+import select
+import signal
+import struct
 import sys
 import threading
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
 
 try:
@@ -13,50 +19,182 @@ except ImportError:
     print("Missing 'hidapi' package. Install with: pip install hidapi")
     sys.exit(1)
 
+from hidd import HiddClient
+
 WL_VID = 0x574C
 WL_PID = 0xE6E3
 RAW_HID_USAGE_PAGE = 0xFF60
 RAW_HID_USAGE = 0x61
 MSG_LEN = 32
+PATH_CACHE = Path("/tmp/claude-kbd-path")  # last Raw HID path that opened
+
+# Fixed commands, built once
+PING = bytes([0xF0])
+ENTER_DIRECT = bytes([0x05])
+ALL_OFF = bytes([0x04, 0, 0, 0])
+UNDERGLOW_OFF = bytes([0x06, 0, 0, 0])
+RESTORE = bytes([0x03])
+
+# Variable commands
+SET_LED = struct.Struct("5B")        # 0x01, idx, h, s, v
+SET_HSV = struct.Struct("4B")        # 0x04 all / 0x06 underglow, h, s, v
+SET_BLINK = struct.Struct("3B")      # 0x07, idx, enable
+SET_BLINK_SPEED = struct.Struct("<BH")  # 0x08, period_ms
+
+MAX_PENDING = 64  # coalesced writes waiting for the sender thread
+READ_TIMEOUT = 0.5   # seconds to wait for a command's reply
+READ_SLICE_MS = 50   # reply wait granularity; lets a queued send() cut it short
 
 dev = None
 dev_lock = threading.Lock()
+tx_buf = bytearray(MSG_LEN + 1)  # report ID 0 + zero-padded payload, guarded by dev_lock
+tx_len = 0
+lock_waiters = 0  # send() calls blocked on dev_lock
+lock_waiters_lock = threading.Lock()
+
+# Writes from the UI are coalesced by (cmd, idx): while one HID round-trip
+# is in flight, newer values replace older unsent ones for the same target.
+pending = {}  # (cmd, idx) → msg, oldest first
+pending_cond = threading.Condition()
+sending = False
 
 
 def connect():
     global dev
-    d = hid.device()
+    # A running hidd broker owns the device; sharing it lets vial_kbd.py run too
+    try:
+        dev = HiddClient()
+        return True
+    except OSError:
+        pass
+
+    # Try the last path that worked first; enumeration walks every USB device
+    try:
+        cached = PATH_CACHE.read_bytes()
+    except OSError:
+        cached = None
+    if cached:
+        d = hid.device()
+        try:
+            d.open_path(cached)
+            dev = d
+        except OSError:
+            pass
+        else:
+            # Paths can be reused by another device after a replug
+            resp = send(PING)
+            if resp and resp[0] == 0xF0 and resp[1] == 0x01:
+                return True
+            d.close()
+            dev = None
+
     for desc in hid.enumerate(WL_VID, WL_PID):
         if desc["usage_page"] == RAW_HID_USAGE_PAGE and desc["usage"] == RAW_HID_USAGE:
+            d = hid.device()
             try:
                 d.open_path(desc["path"])
-                dev = d
-                return True
             except OSError:
                 continue
+            dev = d
+            try:
+                PATH_CACHE.write_bytes(desc["path"])
+            except OSError:
+                pass
+            return True
     return False
 
 
 def send(msg):
+    global tx_len, lock_waiters
+    with lock_waiters_lock:
+        lock_waiters += 1
     with dev_lock:
+        with lock_waiters_lock:
+            lock_waiters -= 1
         if not dev:
             return None
-        padded = msg + b"\x00" * (MSG_LEN - len(msg))
+        # Overwrite the payload in place; only re-zero what the last msg used
+        n = len(msg)
+        tx_buf[1:1 + n] = msg
+        if n < tx_len:
+            tx_buf[1 + n:1 + tx_len] = bytes(tx_len - n)
+        tx_len = n
         try:
-            dev.write(b"\x00" + padded)
-            return bytes(dev.read(MSG_LEN, timeout_ms=500))
+            dev.write(bytes(tx_buf))
+            # Wait for the reply in short slices. Give up early if another
+            # send() is queued behind us, so a keyboard that stops answering
+            # only stalls one request instead of every request behind it.
+            deadline = time.monotonic() + READ_TIMEOUT
+            while True:
+                data = dev.read(MSG_LEN, timeout_ms=READ_SLICE_MS)
+                # Anything else is a late reply to an abandoned read, or a key event
+                if data and data[0] == msg[0]:
+                    return bytes(data)
+                if lock_waiters or time.monotonic() >= deadline:
+                    return None
         except OSError:
             return None
 
 
+def submit(key, msg):
+    """Queue msg for the sender thread, replacing any unsent msg with the same key."""
+    with pending_cond:
+        while key not in pending and len(pending) >= MAX_PENDING:
+            pending_cond.wait()
+        pending.pop(key, None)  # re-append so ordering follows the latest write
+        pending[key] = msg
+        pending_cond.notify_all()
+
+
+def flush():
+    """Block until every queued write has been sent."""
+    with pending_cond:
+        while pending or sending:
+            pending_cond.wait()
+
+
+def sender():
+    global sending
+    while True:
+        with pending_cond:
+            while not pending:
+                pending_cond.wait()
+            key = next(iter(pending))
+            msg = pending.pop(key)
+            sending = True
+            pending_cond.notify_all()
+        send(msg)
+        with pending_cond:
+            sending = False
+            pending_cond.notify_all()
+
+
 class Handler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: every response sets Content-Length
+
+    # Page served from memory; loaded once by load_html()
+    html = b""
+    etag = ""
+
+    @classmethod
+    def load_html(cls):
+        cls.html = (Path(__file__).parent / "led_ui.html").read_bytes()
+        cls.etag = '"%s"' % hashlib.sha256(cls.html).hexdigest()[:16]
+
     def do_GET(self):
         if self.path == "/" or self.path == "/index.html":
-            content = (Path(__file__).parent / "led_ui.html").read_bytes()
+            if self.headers.get("If-None-Match") == self.etag:
+                self.send_response(304)
+                self.send_header("ETag", self.etag)
+                self.end_headers()
+                return
             self.send_response(200)
             self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(self.html)))
+            self.send_header("ETag", self.etag)
+            self.send_header("Cache-Control", "no-cache")  # always revalidate
             self.end_headers()
-            self.wfile.write(content)
+            self.wfile.write(self.html)
         else:
             self.send_error(404)
 
@@ -65,75 +203,94 @@ class Handler(SimpleHTTPRequestHandler):
         body = json.loads(self.rfile.read(length)) if length else {}
 
         if self.path == "/api/init":
-            send(bytes([0x05]))
-            send(bytes([0x04, 0, 0, 0]))
+            flush()
+            send(ENTER_DIRECT)
+            send(ALL_OFF)
             result = {"ok": True}
 
         elif self.path == "/api/led":
             idx = body["idx"]
             h, s, v = body["h"], body["s"], body["v"]
-            send(bytes([0x01, idx, h, s, v]))
+            submit((0x01, idx), SET_LED.pack(0x01, idx, h, s, v))
             result = {"ok": True}
 
         elif self.path == "/api/all":
             h, s, v = body["h"], body["s"], body["v"]
-            send(bytes([0x04, h, s, v]))
+            submit((0x04, None), SET_HSV.pack(0x04, h, s, v))
             result = {"ok": True}
 
         elif self.path == "/api/blink":
             idx = body["idx"]
             enable = body["enable"]
-            send(bytes([0x07, idx, 1 if enable else 0]))
+            submit((0x07, idx), SET_BLINK.pack(0x07, idx, 1 if enable else 0))
             result = {"ok": True}
 
         elif self.path == "/api/blink-speed":
             ms = body["ms"]
-            send(bytes([0x08, ms & 0xFF, (ms >> 8) & 0xFF]))
+            submit((0x08, None), SET_BLINK_SPEED.pack(0x08, ms & 0xFFFF))
             result = {"ok": True}
 
         elif self.path == "/api/underglow":
             h, s, v = body["h"], body["s"], body["v"]
-            send(bytes([0x06, h, s, v]))
+            submit((0x06, None), SET_HSV.pack(0x06, h, s, v))
             result = {"ok": True}
 
         elif self.path == "/api/restore":
-            send(bytes([0x03]))
+            flush()
+            send(RESTORE)
             result = {"ok": True}
 
         else:
             self.send_error(404)
             return
 
+        reply = json.dumps(result).encode()
         self.send_response(200)
         self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
         self.end_headers()
-        self.wfile.write(json.dumps(result).encode())
+        self.wfile.write(reply)
 
     def log_message(self, format, *args):
         pass  # quiet
 
 
 def main():
+    Handler.load_html()
+
     if not connect():
         print("Could not connect to keyboard.")
-        print("Make sure vial_kbd.py is not running (it holds exclusive HID access).")
+        print("Make sure vial_kbd.py is not running (it holds exclusive HID access),")
+        print("or start hidd.py first so both can share the keyboard.")
         sys.exit(1)
 
     # Enter direct mode, turn off underglow default effect
-    send(bytes([0x05]))
-    send(bytes([0x06, 0, 0, 0]))
+    send(ENTER_DIRECT)
+    send(UNDERGLOW_OFF)
+    threading.Thread(target=sender, daemon=True).start()
 
-    port = 8787
-    server = HTTPServer(("127.0.0.1", port), Handler)
+    port = 8788  # 8787 is the vial_kbd.py dashboard
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
     print(f"LED UI → http://localhost:{port}")
     print("Ctrl+C to quit\n")
 
-    try:
-        server.serve_forever()
-    except KeyboardInterrupt:
-        send(bytes([0x03]))  # restore normal effect
-        dev.close()
-        print("\nBye.")
+    # Serve from a thread and park the main thread on the signal wakeup fd,
+    # so Ctrl+C or SIGTERM restores the keyboard immediately rather than
+    # after whatever request or HID read is in progress.
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_w, False)
+    signal.set_wakeup_fd(wake_w)
+    signal.signal(signal.SIGINT, lambda sig, frame: None)
+    signal.signal(signal.SIGTERM, lambda sig, frame: None)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05},
+                     daemon=True).start()
+    select.select([wake_r], [], [])
+
+    server.shutdown()
+    flush()
+    send(RESTORE)  # restore normal effect
+    dev.close()
+    print("\nBye.")
 
 
 if __name__ == "__main__":
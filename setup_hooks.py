@@ -4,6 +4,7 @@ Run once to set up. Run with --remove to undo.
 """
 
 import json
+import os
 import sys
 from pathlib import Path
 
@@ -17,22 +18,41 @@ EVENTS_TO_HOOK = ["Notification", "Stop", "PreToolUse", "PostToolUse", "UserProm
 MARKER = "claude-kbd-bridge"  # identify our hooks for clean removal
 
 
+def load_settings():
+    return json.loads(SETTINGS_PATH.read_bytes())
+
+
+def save_settings(settings):
+    """Write via a temp file + rename so a crash can't leave settings.json half-written."""
+    # Replace the real file, so a symlinked settings.json (dotfiles) stays a link
+    path = SETTINGS_PATH.resolve()
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w") as f:
+        f.write(json.dumps(settings, indent=2) + "\n")
+        f.flush()
+        os.fsync(f.fileno())  # contents on disk before the rename makes them current
+    os.chmod(tmp, path.stat().st_mode & 0o777)
+    os.replace(tmp, path)
+
+
 def add_hooks():
-    settings = json.loads(SETTINGS_PATH.read_text())
+    settings = load_settings()
     hooks = settings.setdefault("hooks", {})
 
-    for event in EVENTS_TO_HOOK:
-        matchers = hooks.setdefault(event, [])
+    # Events that already have our hook, found in a single pass
+    existing = {
+        event
+        for event, matchers in hooks.items()
+        for m in matchers
+        for h in m.get("hooks", [])
+        if MARKER in h.get("command", "")
+    }
 
-        # Check if we already added our hook
-        already = any(
-            MARKER in h.get("command", "")
-            for m in matchers
-            for h in m.get("hooks", [])
-        )
-        if already:
+    for event in EVENTS_TO_HOOK:
+        if event in existing:
             print(f"  {event}: already configured")
             continue
+        matchers = hooks.setdefault(event, [])
 
         # Append a new matcher entry with our hook
         matchers.append({
@@ -47,12 +67,12 @@ def add_hooks():
         })
         print(f"  {event}: added keyboard hook")
 
-    SETTINGS_PATH.write_text(json.dumps(settings, indent=2) + "\n")
+    save_settings(settings)
     print("\nDone! Hooks saved to", SETTINGS_PATH)
 
 
 def remove_hooks():
-    settings = json.loads(SETTINGS_PATH.read_text())
+    settings = load_settings()
     hooks = settings.get("hooks", {})
 
     for event in EVENTS_TO_HOOK:
@@ -65,7 +85,7 @@ def remove_hooks():
         if not hooks[event]:
             del hooks[event]
 
-    SETTINGS_PATH.write_text(json.dumps(settings, indent=2) + "\n")
+    save_settings(settings)
     print("Removed keyboard hooks from", SETTINGS_PATH)
 
 
@@ -18,8 +18,11 @@ LED slot mapping (rows 1-2, left-to-right, top-to-bottom):
 Top row LEDs 10, 11: global attention indicator.
 """
 
+import heapq
 import json
 import math
+import os
+import select
 import signal
 import struct
 import subprocess
@@ -27,6 +30,7 @@ import sys
 import time
 from pathlib import Path
 import threading
+from collections import deque
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 
@@ -36,7 +40,20 @@ except ImportError:
     print("Missing 'hidapi' package. Install with: pip install hidapi")
     sys.exit(1)
 
+from hidd import CMD_CHANGED, HiddClient
+
+try:
+    from orjson import loads as json_loads  # optional: faster JSONL decoding
+except ImportError:
+    json_loads = json.loads
+
+try:
+    from watchfiles import Change, watch
+except ImportError:
+    watch = None  # optional: fall back to polling STATE_FILE every tick
+
 STATE_FILE = Path("/tmp/claude-kbd-events.jsonl")
+PATH_CACHE = Path("/tmp/claude-kbd-path")  # last Raw HID path that opened (shared with led_ui)
 
 # --- LED layout ---
 ROW_LEDS = {
@@ -65,6 +82,12 @@ ORANGE_H, ORANGE_S, ORANGE_V = 9, 255, 200
 DIM_V = 80    # brightness for "working" state
 STALE_V = 30  # very dim for stale sessions (idle >5 min)
 
+# The HSV triples update_leds uses, as frame bytes
+HSV_OFF = bytes((0, 0, 0))
+HSV_BRIGHT = bytes((ORANGE_H, ORANGE_S, ORANGE_V))
+HSV_DIM = bytes((ORANGE_H, ORANGE_S, DIM_V))
+HSV_STALE = bytes((ORANGE_H, ORANGE_S, STALE_V))
+
 # Events that mean "your turn"
 YOUR_TURN = {"Stop"}
 YOUR_TURN_NOTIF = {"permission_prompt", "elicitation_dialog"}
@@ -72,6 +95,15 @@ YOUR_TURN_NOTIF = {"permission_prompt", "elicitation_dialog"}
 # Events that mean "claude is working"
 CLAUDE_WORKING = {"PreToolUse", "UserPromptSubmit"}
 
+# Session states (Session.state); STATE_NAMES gives the dashboard's names
+STATE_WORKING, STATE_YOUR_TURN, STATE_ACKNOWLEDGED = range(3)
+STATE_NAMES = ("working", "your_turn", "acknowledged")
+
+# Dispatch table: event name, or ("Notification", notif), → new session state
+ACTION = {e: STATE_YOUR_TURN for e in YOUR_TURN}
+ACTION.update({("Notification", n): STATE_YOUR_TURN for n in YOUR_TURN_NOTIF})
+ACTION.update({e: STATE_WORKING for e in CLAUDE_WORKING})
+
 # Session timeouts
 DIM_TIMEOUT = 300    # 5 min: dim LED if no events
 RELEASE_TIMEOUT = 600  # 10 min: release slot
@@ -85,6 +117,23 @@ BREATHE_PERIOD = 3.0
 BREATHE_MIN_V = 10
 BREATHE_MAX_V = 120
 
+
+def _wave_lut(lo, hi):
+    """One sine cycle of brightness between lo and hi, starting at lo, in 256 steps.
+
+    Values are snapped to PULSE_QUANT so consecutive ticks often repeat a
+    value and the write can be skipped.
+    """
+    return bytes(
+        int(lo + (hi - lo) * (math.sin(i / 256 * 2 * math.pi - math.pi / 2) + 1) / 2)
+        // PULSE_QUANT * PULSE_QUANT
+        for i in range(256)
+    )
+
+
+PULSE_LUT = _wave_lut(DIM_V, ORANGE_V)
+BREATHE_LUT = _wave_lut(BREATHE_MIN_V, BREATHE_MAX_V)
+
 # --- USB constants ---
 WL_VID = 0x574C
 WL_PID = 0xE6E3
@@ -95,24 +144,58 @@ MSG_LEN = 32
 
 CMD_KEY_EVENT = 0xEE
 
+# --- Main loop timing ---
+TICK = 0.05             # animation / key polling interval
+RECONNECT_INTERVAL = 3  # seconds between connection attempts
+HEARTBEAT_INTERVAL = 5  # seconds between keyboard pings
+IDLE_POLL_MAX = 0.5     # longest event-file poll interval without watchfiles
+
+
+# === Logging ===
+
+# Main-loop output is queued and written in one go per tick by flush_log()
+LOG = []
+
+
+def log(msg):
+    LOG.append(msg)
+
+
+def flush_log():
+    if LOG:
+        sys.stdout.write("".join(line + "\n" for line in LOG))
+        sys.stdout.flush()
+        LOG.clear()
+
 
 # === Session tracking ===
 
 class Session:
-    __slots__ = ("session_id", "iterm_session", "state", "slot", "last_event_time")
+    __slots__ = ("session_id", "iterm_session", "state", "slot", "last_event_time", "dim_at")
 
     def __init__(self, session_id, iterm_session, slot):
         self.session_id = session_id
         self.iterm_session = iterm_session
-        self.state = "working"  # "your_turn", "acknowledged", or "working"
+        self.state = STATE_WORKING
         self.slot = slot
+        self.touch()
+
+    def touch(self):
+        """Record an event for this session now."""
         self.last_event_time = time.monotonic()
+        self.dim_at = self.last_event_time + DIM_TIMEOUT
 
 
 class SessionManager:
     def __init__(self):
         self.sessions = {}       # session_id → Session
-        self.slot_used = [False] * MAX_SLOTS
+        self.slot_sessions = [None] * MAX_SLOTS  # slot → Session
+        # Sessions per state, kept current by set_state()
+        self._your_turn_count = 0
+        self._working_count = 0
+        # (release deadline, session_id), pushed once per session and
+        # re-pushed lazily when a session turns out to have had events since
+        self._expiry_heap = []
 
     def get_or_create(self, session_id, iterm_session=None):
         if session_id in self.sessions:
@@ -120,7 +203,7 @@ class SessionManager:
             # Update iterm_session if we get a better one
             if iterm_session and not sess.iterm_session:
                 sess.iterm_session = iterm_session
-            sess.last_event_time = time.monotonic()
+            sess.touch()
             return sess
 
         slot = self._next_slot()
@@ -129,61 +212,95 @@ class SessionManager:
 
         sess = Session(session_id, iterm_session, slot)
         self.sessions[session_id] = sess
-        self.slot_used[slot] = True
+        self.slot_sessions[slot] = sess
+        self._working_count += 1
+        heapq.heappush(self._expiry_heap, (sess.last_event_time + RELEASE_TIMEOUT, session_id))
         return sess
 
     def _next_slot(self):
-        for i, used in enumerate(self.slot_used):
-            if not used:
+        for i, sess in enumerate(self.slot_sessions):
+            if sess is None:
                 return i
         return None
 
+    def _count(self, state, delta):
+        if state == STATE_YOUR_TURN:
+            self._your_turn_count += delta
+        elif state == STATE_WORKING:
+            self._working_count += delta
+
+    def set_state(self, sess, state):
+        """Move sess to `state`. Returns False if it was already there."""
+        if sess.state == state:
+            return False
+        self._count(sess.state, -1)
+        self._count(state, 1)
+        sess.state = state
+        return True
+
     def release(self, session_id):
         sess = self.sessions.pop(session_id, None)
         if sess:
-            self.slot_used[sess.slot] = False
+            self.slot_sessions[sess.slot] = None
+            self._count(sess.state, -1)
 
     def get_by_slot(self, slot):
-        for sess in self.sessions.values():
-            if sess.slot == slot:
-                return sess
-        return None
+        return self.slot_sessions[slot]
+
+    def slots_used(self):
+        return len(self.sessions)
 
     def any_your_turn(self):
-        return any(s.state == "your_turn" for s in self.sessions.values())
+        return self._your_turn_count > 0
+
+    def any_working(self):
+        return self._working_count > 0
+
+    def any_animating(self, now):
+        """True if a pulsing or breathing LED isn't yet stale (dimmed LEDs hold still)."""
+        if not (self._your_turn_count or self._working_count):
+            return False
+        return any(s.state != STATE_ACKNOWLEDGED and now < s.dim_at
+                   for s in self.sessions.values())
 
     def all_working(self):
-        return bool(self.sessions) and all(
-            s.state == "working" for s in self.sessions.values()
-        )
+        return bool(self.sessions) and self._working_count == len(self.sessions)
 
     def cleanup_stale(self):
         """Release slots for sessions with no recent events."""
         now = time.monotonic()
-        stale = [
-            sid for sid, s in self.sessions.items()
-            if now - s.last_event_time > RELEASE_TIMEOUT
-        ]
-        for sid in stale:
-            self.release(sid)
+        stale = []
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            _, sid = heapq.heappop(heap)
+            sess = self.sessions.get(sid)
+            if sess is None:
+                continue  # already released
+            expires = sess.last_event_time + RELEASE_TIMEOUT
+            if expires > now:
+                heapq.heappush(heap, (expires, sid))
+            else:
+                self.release(sid)
+                stale.append(sid)
         return stale
 
-    def get_dimmed(self):
-        """Return sessions that should be dimmed (no events for DIM_TIMEOUT)."""
-        now = time.monotonic()
-        return [
-            s for s in self.sessions.values()
-            if now - s.last_event_time > DIM_TIMEOUT
-        ]
+    def next_expiry(self):
+        """Earliest time cleanup_stale() may release a session, or None."""
+        return self._expiry_heap[0][0] if self._expiry_heap else None
 
 
 # === Protocol abstraction ===
 
 class KeyboardProtocol:
+    last_scene = None  # what update_leds last sent to this keyboard
+    shared = False  # other clients (led_ui.py via hidd) may change the LEDs too
+    clobbered = False  # set when another client changed the LEDs or underglow
+
     def connect(self):
         raise NotImplementedError
 
     def enter_direct_mode(self):
+        """Take over the per-key LEDs. A no-op if already in direct mode."""
         raise NotImplementedError
 
     def set_led(self, idx, h, s, v):
@@ -192,6 +309,13 @@ class KeyboardProtocol:
     def set_all_leds(self, h, s, v):
         raise NotImplementedError
 
+    def set_led_range(self, start, count, hsv_bytes):
+        """Set `count` LEDs from `start`; hsv_bytes holds an h, s, v byte triple per LED.
+
+        Returns True if every report was sent.
+        """
+        raise NotImplementedError
+
     def set_blink(self, idx, enable):
         raise NotImplementedError
 
@@ -212,6 +336,10 @@ class KeyboardProtocol:
         """Returns True if keyboard is still connected."""
         raise NotImplementedError
 
+    def fileno(self):
+        """Fd that turns readable when a key event may be waiting, or None."""
+        return None
+
     def close(self):
         raise NotImplementedError
 
@@ -219,47 +347,125 @@ class KeyboardProtocol:
 class RawHIDProtocol(KeyboardProtocol):
     def __init__(self):
         self.dev = None
+        self._last_sent = {}  # state key → last payload written, to skip no-op writes
+        self._leds = None  # firmware LED buffer as we last set it (hsv bytes); None = unknown
+        self._pending_keys = deque()  # key events read while waiting for a reply
+        self._wbuf = bytearray(MSG_LEN + 1)  # report ID 0 + zero-padded payload
+        self._wlen = 0  # payload bytes of _wbuf the last command used
+        self._in_direct_mode = False
+
+    @property
+    def shared(self):
+        return isinstance(self.dev, HiddClient)
 
     def connect(self):
+        return self.connect_known() or self.connect_enumerated()
+
+    def connect_enumerated(self):
+        """Connect to the first Raw HID interface found on the USB bus."""
         for desc in hid.enumerate(WL_VID, WL_PID):
             if desc["usage_page"] == RAW_HID_USAGE_PAGE and desc["usage"] == RAW_HID_USAGE:
                 try:
-                    dev = hid.device()
-                    dev.open_path(desc["path"])
-                    self.dev = dev
+                    self.dev = self._open_path(desc["path"])
                 except OSError:
                     continue
-                resp = self._send(bytes([0xF0]))
-                if resp and resp[0] == 0xF0 and resp[1] == 0x01:
-                    led_count = resp[2]
-                    print(f"Raw HID connected ({led_count} LEDs)")
+                if self._handshake():
+                    try:
+                        PATH_CACHE.write_bytes(desc["path"])
+                    except OSError:
+                        pass
                     return True
-                self.dev.close()
-                self.dev = None
         return False
 
-    def _send(self, msg):
-        """Send a command and read until we get a matching response.
+    def connect_known(self):
+        """Connect without walking the USB bus: via hidd, or the last path that worked."""
+        # Prefer a running hidd broker, which lets led_ui.py share the keyboard
+        try:
+            self.dev = HiddClient(subscribe_keys=True)
+        except OSError:
+            pass
+        else:
+            if self._handshake("via hidd"):
+                return True
 
-        Stashes any 0xEE key events received while waiting.
+        try:
+            cached = PATH_CACHE.read_bytes()
+        except OSError:
+            return False
+        try:
+            self.dev = self._open_path(cached)
+        except OSError:
+            return False
+        # The handshake also guards against the path now belonging to another device
+        return self._handshake()
+
+    @staticmethod
+    def _open_path(path):
+        dev = hid.device()
+        dev.open_path(path)
+        # Plain read() returns at once when nothing is queued; replies are
+        # still awaited with read(timeout_ms=...), which ignores this
+        dev.set_nonblocking(1)
+        return dev
+
+    def _handshake(self, how=""):
+        """Ping the freshly opened self.dev; close it again if it doesn't answer."""
+        resp = self._send_sync(bytes([0xF0]))
+        if resp and resp[0] == 0xF0 and resp[1] == 0x01:
+            led_count = resp[2]
+            via = f", {how}" if how else ""
+            print(f"Raw HID connected ({led_count} LEDs{via})")
+            return True
+        self.dev.close()
+        self.dev = None
+        return False
+
+    def _send_async(self, msg):
+        """Send a command without waiting for its reply. Returns None on failure.
+
+        The firmware still acks it; poll_key_event skips those acks.
         """
         if not self.dev:
             return None
-        padded = msg + b"\x00" * (MSG_LEN - len(msg))
+        # Overwrite the payload in place; only re-zero what the last msg used
+        n = len(msg)
+        self._wbuf[1:1 + n] = msg
+        if n < self._wlen:
+            self._wbuf[1 + n:1 + self._wlen] = bytes(self._wlen - n)
+        self._wlen = n
         try:
-            self.dev.write(b"\x00" + padded)
+            self.dev.write(bytes(self._wbuf))
         except OSError:
             return None
+        return True
+
+    def _send_sync(self, msg):
+        """Send a command and read until we get a matching response.
+
+        Stashes any 0xEE key events received while waiting.
+        """
+        if self._send_async(msg) is None:
+            return None
         return self._read_response(msg[0])
 
+    def _send_cached(self, key, msg):
+        """Send msg unless it repeats the last payload sent for the same state key."""
+        if self._last_sent.get(key) == msg:
+            return
+        if self._send_async(msg) is not None:
+            self._last_sent[key] = msg
+
+    def _forget_blink(self):
+        # Firmware clears blink_mask on enter-direct-mode and restore
+        for idx in range(NUM_LEDS):
+            self._last_sent.pop(("blink", idx), None)
+
     def _read_response(self, expected_cmd, timeout_ms=500):
         """Read HID reports until we get one matching expected_cmd.
 
         Any 0xEE key events received in the meantime are stashed
         in self._pending_keys for later polling.
         """
-        if not hasattr(self, "_pending_keys"):
-            self._pending_keys = []
         deadline = time.monotonic() + timeout_ms / 1000
         while time.monotonic() < deadline:
             remaining = max(1, int((deadline - time.monotonic()) * 1000))
@@ -273,54 +479,112 @@ class RawHIDProtocol(KeyboardProtocol):
             if raw[0] == CMD_KEY_EVENT:
                 self._pending_keys.append((raw[1], raw[2]))
                 continue
+            if raw[0] == CMD_CHANGED:
+                self._note_change(raw[1])
+                continue
             if raw[0] == expected_cmd:
                 return raw
         return None
 
     def enter_direct_mode(self):
-        self._send(bytes([0x05]))
+        if self._in_direct_mode:
+            return
+        self._forget_blink()
+        if self._send_async(bytes([0x05])):
+            self._in_direct_mode = True
+            # hidd acks this without clearing anything, and other clients can
+            # change the LEDs at any time, so there we keep no shadow at all
+            self._leds = None if self.shared else bytearray(3 * NUM_LEDS)  # firmware clears led_buf
+        else:
+            self._leds = None
 
     def set_led(self, idx, h, s, v):
-        self._send(bytes([0x01, idx, h, s, v]))
+        hsv = bytes((h, s, v))
+        if self._leds is not None and self._leds[3 * idx:3 * idx + 3] == hsv:
+            return  # already showing
+        if self._send_async(bytes([0x01, idx, h, s, v])) and self._leds is not None:
+            self._leds[3 * idx:3 * idx + 3] = hsv
 
     def set_all_leds(self, h, s, v):
-        self._send(bytes([0x04, h, s, v]))
+        frame = bytes((h, s, v)) * NUM_LEDS
+        if self._leds == frame:
+            return
+        if self._send_async(bytes([0x04, h, s, v])):
+            self._leds = bytearray(frame)
+
+    def set_led_range(self, start, count, hsv_bytes):
+        # Firmware takes up to 9 LEDs per report; skip reports that change nothing
+        ok = True
+        for off in range(0, count, 9):
+            n = min(9, count - off)
+            first = start + off
+            chunk = hsv_bytes[3 * off:3 * (off + n)]
+            if self._leds is not None and self._leds[3 * first:3 * (first + n)] == chunk:
+                continue
+            if not self._send_async(bytes([0x02, first, n]) + chunk):
+                ok = False
+            elif self._leds is not None:
+                self._leds[3 * first:3 * (first + n)] = chunk
+        return ok
 
     def set_blink(self, idx, enable):
-        self._send(bytes([0x07, idx, 1 if enable else 0]))
+        self._send_cached(("blink", idx), bytes([0x07, idx, 1 if enable else 0]))
 
     def set_underglow(self, h, s, v):
-        self._send(bytes([0x06, h, s, v]))
+        self._send_cached("underglow", bytes([0x06, h, s, v]))
 
     def set_underglow_breathe(self, h, s, v):
-        self._send(bytes([0x0A, h, s, v]))
+        self._send_cached("underglow", bytes([0x0A, h, s, v]))
 
     def restore_effect(self):
-        self._send(bytes([0x03]))
+        self._send_async(bytes([0x03]))
+        self._in_direct_mode = False
+        self._forget_blink()
+        self._leds = None
+
+    def _note_change(self, cmd):
+        """Another hidd client ran `cmd`; forget whatever it may have overwritten."""
+        if cmd in (0x06, 0x0A):
+            self._last_sent.pop("underglow", None)
+        elif cmd == 0x07:
+            self._forget_blink()
+        else:
+            self.last_scene = None
+        self.clobbered = True
 
     def poll_key_event(self):
-        if not hasattr(self, "_pending_keys"):
-            self._pending_keys = []
         # Check for stashed events first
         if self._pending_keys:
-            return self._pending_keys.pop(0)
-        # Non-blocking read
+            return self._pending_keys.popleft()
+        # Non-blocking read. Acks for fire-and-forget commands arrive on the
+        # same pipe, so skip past them to the first key event.
         if not self.dev:
             return None
-        try:
-            data = self.dev.read(MSG_LEN, timeout_ms=5)
-        except OSError:
-            return None
-        if data:
-            raw = bytes(data)
-            if raw[0] == CMD_KEY_EVENT:
-                return (raw[1], raw[2])
-        return None
+        while True:
+            try:
+                data = self.dev.read(MSG_LEN)
+            except OSError:
+                # Device unplugged or hidd gone. Drop it so its fd stops
+                # waking select() at EOF; the next heartbeat reconnects.
+                self.close()
+                self.dev = None
+                return None
+            if not data:
+                return None
+            if data[0] == CMD_KEY_EVENT:
+                return (data[1], data[2])
+            if data[0] == CMD_CHANGED:
+                self._note_change(data[1])
 
     def ping(self):
-        resp = self._send(bytes([0xF0]))
+        resp = self._send_sync(bytes([0xF0]))
         return resp is not None and resp[0] == 0xF0
 
+    def fileno(self):
+        # Only the hidd socket has one; hidapi keeps its device handle private
+        fileno = getattr(self.dev, "fileno", None)
+        return fileno() if fileno else None
+
     def close(self):
         if self.dev:
             self.dev.close()
@@ -337,8 +601,17 @@ class VialRGBProtocol(KeyboardProtocol):
     VIALRGB_DIRECT_FASTSET = 0x42
     VIALRGB_EFFECT_DIRECT = 1
 
+    # Packers and fixed commands, built once
+    _FASTSET_HDR = struct.Struct("<BBHB")  # cmd, sub-cmd, first LED, count
+    _MSG_DIRECT = struct.pack("<BBHBBBB", CMD_VIA_LIGHTING_SET_VALUE, VIALRGB_SET_MODE,
+                              VIALRGB_EFFECT_DIRECT, 128, 128, 128, 128)
+    _MSG_RESTORE = struct.pack("<BBHBBBB", CMD_VIA_LIGHTING_SET_VALUE, VIALRGB_SET_MODE,
+                               0, 128, 128, 128, 128)
+
     def __init__(self):
         self.dev = None
+        self._buf = bytearray(MSG_LEN + 1)  # report ID 0 + zero-padded payload
+        self._in_direct_mode = False
 
     def connect(self):
         for desc in hid.enumerate():
@@ -351,17 +624,17 @@ class VialRGBProtocol(KeyboardProtocol):
                 dev = hid.device()
                 dev.open_path(desc["path"])
                 self.dev = dev
-                resp = self._send(b"\x01")
+                resp = self._send_sync(b"\x01")
                 via_ver = (resp[1] << 8 | resp[2]) if resp else 0
                 if not resp or resp[0] != 0x01 or via_ver < 9:
                     self.dev.close()
                     self.dev = None
                     continue
-                resp = self._send(struct.pack("BB", self.CMD_VIA_LIGHTING_GET_VALUE,
-                                              self.VIALRGB_GET_INFO))
+                resp = self._send_sync(struct.pack("BB", self.CMD_VIA_LIGHTING_GET_VALUE,
+                                                   self.VIALRGB_GET_INFO))
                 if resp and (resp[2] | (resp[3] << 8)) == 1:
-                    resp = self._send(struct.pack("BB", self.CMD_VIA_LIGHTING_GET_VALUE,
-                                                  self.VIALRGB_GET_NUMBER_LEDS))
+                    resp = self._send_sync(struct.pack("BB", self.CMD_VIA_LIGHTING_GET_VALUE,
+                                                       self.VIALRGB_GET_NUMBER_LEDS))
                     if resp:
                         count = struct.unpack("<H", resp[2:4])[0]
                         print(f"VIALRGB connected ({count} LEDs)")
@@ -372,7 +645,7 @@ class VialRGBProtocol(KeyboardProtocol):
                 self.dev = None
         return False
 
-    def _send(self, msg):
+    def _send_sync(self, msg):
         if not self.dev:
             return None
         padded = msg + b"\x00" * (MSG_LEN - len(msg))
@@ -382,27 +655,46 @@ class VialRGBProtocol(KeyboardProtocol):
         except OSError:
             return None
 
+    def _write_buf(self, end):
+        """Zero self._buf past `end`, then send it without waiting for a reply."""
+        if not self.dev:
+            return None
+        self._buf[end:] = bytes(MSG_LEN + 1 - end)
+        try:
+            self.dev.write(bytes(self._buf))
+        except OSError:
+            return None
+        return True
+
+    def _send_async(self, msg):
+        n = len(msg)
+        self._buf[1:1 + n] = msg
+        return self._write_buf(1 + n)
+
+    def _fastset(self, start, hsv_bytes):
+        """Send one FASTSET report for up to 9 LEDs from `start`."""
+        self._FASTSET_HDR.pack_into(self._buf, 1, self.CMD_VIA_LIGHTING_SET_VALUE,
+                                    self.VIALRGB_DIRECT_FASTSET, start, len(hsv_bytes) // 3)
+        off = 1 + self._FASTSET_HDR.size
+        self._buf[off:off + len(hsv_bytes)] = hsv_bytes
+        return self._write_buf(off + len(hsv_bytes))
+
     def enter_direct_mode(self):
-        self._send(struct.pack("<BBHBBBB",
-                               self.CMD_VIA_LIGHTING_SET_VALUE,
-                               self.VIALRGB_SET_MODE,
-                               self.VIALRGB_EFFECT_DIRECT,
-                               128, 128, 128, 128))
+        if not self._in_direct_mode and self._send_async(self._MSG_DIRECT):
+            self._in_direct_mode = True
 
     def set_led(self, idx, h, s, v):
-        payload = struct.pack("<BBHB", self.CMD_VIA_LIGHTING_SET_VALUE,
-                              self.VIALRGB_DIRECT_FASTSET, idx, 1)
-        payload += bytes([h, s, v])
-        self._send(payload)
+        self._fastset(idx, bytes((h, s, v)))
 
     def set_all_leds(self, h, s, v):
-        for start in range(0, NUM_LEDS, 9):
-            batch = min(9, NUM_LEDS - start)
-            payload = struct.pack("<BBHB", self.CMD_VIA_LIGHTING_SET_VALUE,
-                                  self.VIALRGB_DIRECT_FASTSET, start, batch)
-            for _ in range(batch):
-                payload += bytes([h, s, v])
-            self._send(payload)
+        self.set_led_range(0, NUM_LEDS, bytes((h, s, v)) * NUM_LEDS)
+
+    def set_led_range(self, start, count, hsv_bytes):
+        ok = True
+        for off in range(0, count, 9):
+            if not self._fastset(start + off, hsv_bytes[3 * off:3 * min(off + 9, count)]):
+                ok = False
+        return ok
 
     def set_blink(self, idx, enable):
         pass  # VIALRGB doesn't support firmware-side blink
@@ -414,10 +706,8 @@ class VialRGBProtocol(KeyboardProtocol):
         pass
 
     def restore_effect(self):
-        self._send(struct.pack("<BBHBBBB",
-                               self.CMD_VIA_LIGHTING_SET_VALUE,
-                               self.VIALRGB_SET_MODE,
-                               0, 128, 128, 128, 128))
+        self._send_async(self._MSG_RESTORE)
+        self._in_direct_mode = False
 
     def poll_key_event(self):
         return None  # VIALRGB firmware doesn't send key events
@@ -432,71 +722,256 @@ class VialRGBProtocol(KeyboardProtocol):
 
 # === Event processing ===
 
-def read_new_events(pos):
-    if not STATE_FILE.exists():
-        return [], pos
-    size = STATE_FILE.stat().st_size
-    if size < pos:
-        pos = 0
-    if size == pos:
-        return [], pos
-    events = []
-    with open(STATE_FILE) as f:
-        f.seek(pos)
-        for line in f:
-            line = line.strip()
+class EventTail:
+    """Follows STATE_FILE as hook.sh appends to it, across truncation and rotation."""
+
+    def __init__(self):
+        self.fh = None
+        self.ident = None  # (st_dev, st_ino) of the open file
+        # Skip events written before we started
+        if self._open():
+            self.fh.seek(0, os.SEEK_END)
+
+    def _open(self):
+        """Open STATE_FILE; returns its size, or None if it doesn't exist yet."""
+        try:
+            self.fh = open(STATE_FILE, "rb", buffering=1 << 16)
+        except FileNotFoundError:
+            return None
+        st = os.fstat(self.fh.fileno())
+        self.ident = (st.st_dev, st.st_ino)
+        return st.st_size
+
+    def close(self):
+        if self.fh:
+            self.fh.close()
+            self.fh = None
+
+    def read_new(self):
+        """Return the events appended since the last call.
+
+        One stat() of the path covers the common case: whether the file
+        exists, whether it is still the one we have open, and whether it
+        has grown. An idle poll makes no other syscall.
+        """
+        try:
+            st = os.stat(STATE_FILE)
+        except FileNotFoundError:
+            # Deleted; finish what's left and wait for a new file to appear
+            return self._read(os.fstat(self.fh.fileno()).st_size) if self.fh else []
+        events = []
+        # An inode number is only unique within one device (e.g. /tmp on its own volume)
+        if self.fh and (st.st_dev, st.st_ino) != self.ident:
+            # Rotated or recreated: finish the old file, then start the new one
+            events = self._read(os.fstat(self.fh.fileno()).st_size)
+            self.close()
+        if self.fh is None:
+            size = self._open()
+            if size is None:
+                return events
+        else:
+            size = st.st_size
+        return events + self._read(size)
+
+    def _read(self, size):
+        """Parse complete lines between the current position and `size`."""
+        pos = self.fh.tell()
+        if size < pos:
+            self.fh.seek(0)  # file was truncated
+            pos = 0
+        if size == pos:
+            return []
+        data = self.fh.read(size - pos)
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # hook.sh is mid-append; rewind and pick the line up once it's complete
+            self.fh.seek(end - len(data), os.SEEK_CUR)
+        events = []
+        # Both decoders take bytes directly
+        for line in data[:end].splitlines():
             if line:
                 try:
-                    events.append(json.loads(line))
-                except json.JSONDecodeError:
+                    events.append(json_loads(line))
+                except ValueError:  # bad JSON, or (stdlib json on bytes) bad UTF-8
                     pass
-        pos = f.tell()
-    return events, pos
+        return events
 
 
-# === iTerm2 tab switching ===
+def read_event_history(n, block=1 << 16):
+    """Return the last n events in STATE_FILE, oldest first.
 
-def activate_iterm_tab(iterm_session_id):
-    """Switch iTerm2 to the tab containing the given session ID.
+    Reads backwards from the end a block at a time, so the cost follows n
+    rather than the size of the file, which only ever grows.
+    """
+    if n <= 0:
+        return []
+    fd = os.open(STATE_FILE, os.O_RDONLY)
+    try:
+        pos = os.fstat(fd).st_size
+        blocks = []  # newest first; joined once at the end
+        newlines = 0
+        while pos > 0 and newlines <= n:
+            size = min(block, pos)
+            pos -= size
+            chunk = os.pread(fd, size, pos)
+            blocks.append(chunk)
+            newlines += chunk.count(b"\n")
+    finally:
+        os.close(fd)
+    blocks.reverse()
+    data = b"".join(blocks)
+    lines = data.splitlines()
+    if pos > 0:
+        lines = lines[1:]  # starts mid-line
+    if not data.endswith(b"\n"):
+        lines = lines[:-1]  # hook.sh is mid-append
+    events = []
+    for line in lines[-n:]:
+        if line:
+            try:
+                events.append(json_loads(line))
+            except ValueError:  # bad JSON, or (stdlib json on bytes) bad UTF-8
+                pass
+    return events
 
-    iterm_session_id format: "w0t0p0:GUID"
-    We extract the tab identifier (e.g. "w0t0") to target the right tab.
+
+def watch_state_file(wake_fd, changed, alive, stop):
+    """Set `changed` and poke the main loop via `wake_fd` whenever STATE_FILE
+    is created or appended to.
+
+    Runs in a background thread while `alive` is set; clears it and returns
+    once `stop` is set, or if the watcher fails.
     """
-    if not iterm_session_id:
-        return
+    def is_state_file(change, path):
+        return change in (Change.added, Change.modified) and Path(path).name == STATE_FILE.name
+
+    # Only the directory itself: recursing into /tmp would wake us for every
+    # file anyone touches there, and dies on subdirectories we can't read
+    try:
+        for _ in watch(str(STATE_FILE.parent), watch_filter=is_state_file, recursive=False,
+                       stop_event=stop, step=5, rust_timeout=2000):
+            changed.set()
+            try:
+                os.write(wake_fd, b"\0")
+            except BlockingIOError:
+                pass  # pipe already full, so the loop is waking anyway
+    except Exception as e:
+        print(f"watchfiles failed ({e}); polling {STATE_FILE.name} instead.")
+    finally:
+        alive.clear()
+        changed.set()  # anything appended since the last change we reported
+        try:
+            os.write(wake_fd, b"\0")
+        except BlockingIOError:
+            pass
 
-    # $ITERM_SESSION_ID format: "w0t0p0:GUID" — extract the GUID part
-    # iTerm2's AppleScript "unique ID" is just the GUID
-    guid = iterm_session_id.split(":")[-1] if ":" in iterm_session_id else iterm_session_id
 
-    script = f'''
+# === iTerm2 tab switching ===
+
+# Takes the session GUID as its one argument. All session IDs are fetched
+# in one Apple Event as a window → tab → session nested list; only the
+# matching window is touched after that.
+ITERM_SELECT_SCRIPT = """
+on run {guid}
     tell application "iTerm2"
         activate
-        repeat with w in windows
-            if miniaturized of w then
-                set miniaturized of w to false
-            end if
-            repeat with t in tabs of w
-                repeat with s in sessions of t
-                    if unique ID of s is "{guid}" then
-                        select t
-                        return
+        set ids to unique ID of sessions of tabs of windows
+        repeat with i from 1 to count of ids
+            set tabIDs to item i of ids
+            repeat with j from 1 to count of tabIDs
+                if item j of tabIDs contains guid then
+                    set w to window i
+                    if miniaturized of w then
+                        set miniaturized of w to false
                     end if
-                end repeat
+                    select tab j of w
+                    return
+                end if
             end repeat
         end repeat
     end tell
-    '''
+end run
+"""
+
+
+def applescript_str(text):
+    """Quote text as an AppleScript string literal."""
+    return '"%s"' % (text.replace("\\", "\\\\").replace('"', '\\"')
+                     .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+_osascript = None  # long-lived `osascript -i`, started on first key press
+_spawned = []      # pids from spawn_detached() not yet reaped
+
+
+def spawn_detached(argv):
+    """Start argv (looked up on PATH) with output discarded; don't wait.
+
+    posix_spawn skips fork()ing the whole interpreter first. Children that
+    have exited since the last call are reaped here, so none linger as
+    zombies.
+    """
+    for pid in list(_spawned):
+        try:
+            done, _ = os.waitpid(pid, os.WNOHANG)
+        except ChildProcessError:
+            done = pid
+        if done:
+            _spawned.remove(pid)
+    _spawned.append(os.posix_spawnp(argv[0], argv, os.environ, file_actions=[
+        (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+        (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0),
+    ]))
+
+
+def run_applescript(source, *args):
+    """Run AppleScript `source` with string `args` without waiting for it.
+
+    `osascript -i` evaluates one line at a time, so the script goes through
+    `run script` as a single statement. Reusing one process saves a fork,
+    exec and interpreter start-up per key press; if it has exited, a new
+    one is started, and a one-shot osascript is the last resort.
+    """
+    global _osascript
+    line = "run script %s with parameters {%s}\n" % (
+        applescript_str(source), ", ".join(applescript_str(a) for a in args))
     try:
-        subprocess.Popen(
-            ["osascript", "-e", script],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
+        if _osascript is None or _osascript.poll() is not None:
+            _osascript = subprocess.Popen(
+                ["osascript", "-i"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                bufsize=1,  # line-buffered: each statement goes out at once
+            )
+        _osascript.stdin.write(line)
+        return
     except FileNotFoundError:
+        return  # not on macOS
+    except OSError:
+        _osascript = None
+    try:
+        spawn_detached(["osascript", "-e", source, *args])
+    except OSError:
         pass
 
 
+def activate_iterm_tab(iterm_session_id):
+    """Switch iTerm2 to the tab containing the given session ID.
+
+    iterm_session_id format: "w0t0p0:GUID"
+    We extract the tab identifier (e.g. "w0t0") to target the right tab.
+    """
+    if not iterm_session_id:
+        return
+
+    # $ITERM_SESSION_ID format: "w0t0p0:GUID" — extract the GUID part
+    # iTerm2's AppleScript "unique ID" is just the GUID
+    guid = iterm_session_id.split(":")[-1] if ":" in iterm_session_id else iterm_session_id
+    run_applescript(ITERM_SELECT_SCRIPT, guid)
+
+
 # === LED update logic ===
 
 def update_leds(kb, mgr):
@@ -508,27 +983,43 @@ def update_leds(kb, mgr):
       working      → solid dim
     Stale overlay (idle >5min) → very dim regardless of state.
     """
-    kb.enter_direct_mode()
-    kb.set_all_leds(0, 0, 0)
-
-    stale = {s.session_id for s in mgr.get_dimmed()}
+    # Build the whole frame, then send it in one batched write
+    now = time.monotonic()
+    frame = bytearray(HSV_OFF * NUM_LEDS)
+    animated = []  # LEDs the pulse/breathe loops take over from here
 
     for sess in mgr.sessions.values():
         led = SLOT_LEDS[sess.slot]
-        is_stale = sess.session_id in stale
 
-        if is_stale:
-            kb.set_led(led, ORANGE_H, ORANGE_S, STALE_V)
-        elif sess.state == "your_turn":
+        if now >= sess.dim_at:
+            frame[3 * led:3 * led + 3] = HSV_STALE
+        elif sess.state == STATE_WORKING:
+            frame[3 * led:3 * led + 3] = HSV_DIM
+            animated.append(led)
+        elif sess.state == STATE_YOUR_TURN:
             # Initial value; the pulse loop animates this
-            kb.set_led(led, ORANGE_H, ORANGE_S, ORANGE_V)
-        elif sess.state == "acknowledged":
-            kb.set_led(led, ORANGE_H, ORANGE_S, ORANGE_V)
-        elif sess.state == "working":
-            kb.set_led(led, ORANGE_H, ORANGE_S, DIM_V)
+            frame[3 * led:3 * led + 3] = HSV_BRIGHT
+            animated.append(led)
+        else:
+            frame[3 * led:3 * led + 3] = HSV_BRIGHT
 
-    # Underglow: always breathing while daemon runs
-    kb.set_underglow_breathe(ORANGE_H, ORANGE_S, ORANGE_V)
+    # Nothing to send if this matches the last update. Animated LEDs have
+    # moved since, but the animation loops keep rewriting those; an LED
+    # that stops animating changes `animated` and so forces a resend.
+    scene = (bytes(frame), sorted(animated))
+    if scene == kb.last_scene:
+        return
+
+    kb.enter_direct_mode()
+    if kb.shared:
+        # Other hidd clients own the rest of the LEDs; repaint only the slots
+        ok = True
+        for led in SLOT_LEDS:
+            ok = kb.set_led_range(led, 1, frame[3 * led:3 * led + 3]) and ok
+    else:
+        ok = kb.set_led_range(0, NUM_LEDS, frame)
+    if ok:
+        kb.last_scene = scene  # a failed write is retried on the next update
 
 
 # === Dashboard web server ===
@@ -590,7 +1081,7 @@ class DashboardHandler(BaseHTTPRequestHandler):
         for sess in list(mgr.sessions.values()):
             sessions.append({
                 "session_id": sess.session_id,
-                "state": sess.state,
+                "state": STATE_NAMES[sess.state],
                 "slot": sess.slot,
                 "led_index": SLOT_LEDS[sess.slot],
                 "idle_seconds": round(now - sess.last_event_time, 1),
@@ -599,27 +1090,17 @@ class DashboardHandler(BaseHTTPRequestHandler):
         self._json({"sessions": sessions})
 
     def _api_events(self, n=200):
-        events = []
-        if STATE_FILE.exists():
-            try:
-                with open(STATE_FILE) as f:
-                    lines = f.readlines()
-                for line in lines[-n:]:
-                    line = line.strip()
-                    if line:
-                        try:
-                            events.append(json.loads(line))
-                        except json.JSONDecodeError:
-                            pass
-            except OSError:
-                pass
+        try:
+            events = read_event_history(n)
+        except OSError:
+            events = []
         self._json({"events": events})
 
     def _api_status(self):
         start = _dashboard["start_time"]
         uptime = time.monotonic() - start if start else 0
         mgr = _dashboard["mgr"]
-        slots_used = sum(mgr.slot_used) if mgr else 0
+        slots_used = mgr.slots_used() if mgr else 0
         self._json({
             "connected": _dashboard["connected"],
             "protocol": _dashboard["protocol"],
@@ -641,13 +1122,31 @@ def start_dashboard(port=DASHBOARD_PORT):
 
 # === Main loop ===
 
+def keyboard_connected(kb):
+    """One-time setup after a (re)connect: publish to the dashboard, start underglow.
+
+    The underglow breathes for as long as the daemon runs; direct mode
+    doesn't touch it, so update_leds never needs to resend it.
+    """
+    _dashboard["connected"] = True
+    _dashboard["protocol"] = type(kb).__name__.replace("Protocol", "")
+    kb.set_underglow_breathe(ORANGE_H, ORANGE_S, ORANGE_V)
+    print(f"Keyboard connected ({_dashboard['protocol']}).")
+
+
 def try_connect():
-    """Try VIALRGB first, fall back to Raw HID. Returns None if not found."""
+    """Connect to the keyboard. Returns None if not found.
+
+    A previously seen Raw HID device is tried first, since that needs no
+    USB enumeration; otherwise VIALRGB is preferred over Raw HID.
+    """
+    raw = RawHIDProtocol()
+    if raw.connect_known():
+        return raw
     vial = VialRGBProtocol()
     if vial.connect():
         return vial
-    raw = RawHIDProtocol()
-    if raw.connect():
+    if raw.connect_enumerated():  # connect_known() already failed above
         return raw
     return None
 
@@ -665,69 +1164,86 @@ def main():
     # Try initial keyboard connection
     kb = try_connect()
     if kb:
-        _dashboard["connected"] = True
-        _dashboard["protocol"] = type(kb).__name__.replace("Protocol", "")
-        kb.set_underglow_breathe(ORANGE_H, ORANGE_S, ORANGE_V)
-        print(f"Keyboard connected ({_dashboard['protocol']}).")
+        keyboard_connected(kb)
     else:
         print("Keyboard not found. Will keep trying...")
 
-    pos = STATE_FILE.stat().st_size if STATE_FILE.exists() else 0
-    last_cleanup = time.monotonic()
+    tail = EventTail()
     last_connect_attempt = time.monotonic()
     last_heartbeat = time.monotonic()
+    next_tick = time.monotonic()
     last_pulse_v = {}
+    idle_polls = 0  # event-file polls in a row that found nothing
+
+    # Writes to the wake pipe cut the inter-tick sleep short. Signals write
+    # to it too (set_wakeup_fd), so Ctrl+C is handled at once even on macOS,
+    # where signals don't interrupt a plain timed wait. `stop` ends the loop
+    # so the LEDs are restored below rather than inside the signal handler.
+    wake_r, wake_w = os.pipe()
+    os.set_blocking(wake_r, False)
+    os.set_blocking(wake_w, False)
+    signal.set_wakeup_fd(wake_w)
+    stop = threading.Event()
+    # Set by the watchfiles thread; without it the file is checked every tick.
+    # Starts set to catch anything written before the watcher is running.
+    state_changed = threading.Event()
+    state_changed.set()
+    # Set while that thread runs; if it never starts or dies, we poll
+    watching = threading.Event()
 
     def quit_handler(sig=None, frame=None):
-        if kb:
-            try:
-                kb.enter_direct_mode()
-                kb.set_all_leds(0, 0, 0)
-                kb.set_underglow(0, 0, 0)
-                kb.close()
-            except Exception:
-                pass
-        print("\nBye.")
-        sys.exit(0)
+        stop.set()
 
     signal.signal(signal.SIGINT, quit_handler)
     signal.signal(signal.SIGTERM, quit_handler)
 
+    if watch is not None:
+        watching.set()
+        threading.Thread(target=watch_state_file, args=(wake_w, state_changed, watching, stop),
+                         daemon=True).start()
+
     print(f"Ready — {MAX_SLOTS} session slots.\n")
 
-    while True:
+    while not stop.is_set():
         now = time.monotonic()
 
         # 0. Reconnect if keyboard not connected
         if kb is None:
-            if now - last_connect_attempt > 3:
+            if now - last_connect_attempt > RECONNECT_INTERVAL:
                 last_connect_attempt = now
                 kb = try_connect()
                 if kb:
-                    _dashboard["connected"] = True
-                    _dashboard["protocol"] = type(kb).__name__.replace("Protocol", "")
-                    kb.set_underglow_breathe(ORANGE_H, ORANGE_S, ORANGE_V)
+                    keyboard_connected(kb)
                     leds_dirty = True
                     last_heartbeat = now
-                    print(f"Keyboard connected ({_dashboard['protocol']}).")
 
         # 1. Heartbeat: detect keyboard disconnection
-        if kb and now - last_heartbeat > 5:
+        if kb and now - last_heartbeat > HEARTBEAT_INTERVAL:
             last_heartbeat = now
             if not kb.ping():
-                print("Keyboard disconnected.")
+                log("Keyboard disconnected.")
                 kb.close()
                 kb = None
                 _dashboard["connected"] = False
                 leds_dirty = False
                 last_pulse_v.clear()
 
-        # 2. Read JSONL events (works without keyboard)
-        events, pos = read_new_events(pos)
+        # 2. Read JSONL events (works without keyboard). With watchfiles
+        # running, the file isn't touched at all until it reports a change.
+        events = ()
+        if not watching.is_set() or state_changed.is_set():
+            state_changed.clear()
+            events = tail.read_new()
+            idle_polls = 0 if events else idle_polls + 1
 
         for ev in events:
             event = ev.get("event", "")
-            notif = ev.get("notif", "")
+            if event == "Notification":
+                notif = ev.get("notif", "")
+                action = ACTION.get((event, notif))
+            else:
+                notif = ""
+                action = ACTION.get(event)
             session_id = ev.get("session", "")
             iterm_session = ev.get("iterm_session", "")
 
@@ -738,18 +1254,16 @@ def main():
             if not sess:
                 continue
 
-            if event in YOUR_TURN or (event == "Notification" and notif in YOUR_TURN_NOTIF):
-                if sess.state != "your_turn":
-                    sess.state = "your_turn"
+            if action == STATE_YOUR_TURN:
+                if mgr.set_state(sess, STATE_YOUR_TURN):
                     leds_dirty = True
-                    print(f"  [{sess.slot}] >>> Your turn ({event} {notif})")
+                    log(f"  [{sess.slot}] >>> Your turn ({event} {notif})")
 
-            elif event in CLAUDE_WORKING:
-                if sess.state in ("your_turn", "acknowledged"):
-                    sess.state = "working"
+            elif action == STATE_WORKING:
+                if mgr.set_state(sess, STATE_WORKING):
                     leds_dirty = True
                     last_pulse_v.pop(SLOT_LEDS[sess.slot], None)
-                    print(f"  [{sess.slot}] <<< Working ({event})")
+                    log(f"  [{sess.slot}] <<< Working ({event})")
 
         # 3. Poll for key events (keyboard required)
         if kb:
@@ -760,24 +1274,31 @@ def main():
                 if slot is not None:
                     sess = mgr.get_by_slot(slot)
                     if sess and sess.iterm_session:
-                        print(f"  [{slot}] KEY row={row} col={col} → iTerm {sess.iterm_session}")
+                        log(f"  [{slot}] KEY row={row} col={col} → iTerm {sess.iterm_session}")
                         activate_iterm_tab(sess.iterm_session)
-                        if sess.state == "your_turn":
-                            sess.state = "acknowledged"
+                        if sess.state == STATE_YOUR_TURN:
+                            mgr.set_state(sess, STATE_ACKNOWLEDGED)
                             leds_dirty = True
                             last_pulse_v.pop(SLOT_LEDS[sess.slot], None)
-                            print(f"  [{slot}] ✓ Acknowledged")
+                            log(f"  [{slot}] ✓ Acknowledged")
                     else:
-                        print(f"  [{slot}] KEY row={row} col={col} (no session)")
+                        log(f"  [{slot}] KEY row={row} col={col} (no session)")
+
+            # Another hidd client drew over us; put our LEDs and underglow back
+            if kb.clobbered:
+                kb.clobbered = False
+                kb.set_underglow_breathe(ORANGE_H, ORANGE_S, ORANGE_V)
+                leds_dirty = True
+                last_pulse_v.clear()
 
-        # 4. Periodic cleanup of stale sessions
-        if now - last_cleanup > 30:
+        # 4. Release stale sessions once the earliest deadline has passed
+        expiry = mgr.next_expiry()
+        if expiry is not None and now >= expiry:
             stale = mgr.cleanup_stale()
             if stale:
                 leds_dirty = True
                 for sid in stale:
-                    print(f"  Released stale session {sid[:8]}...")
-            last_cleanup = now
+                    log(f"  Released stale session {sid[:8]}...")
 
         # 5. Update LEDs if anything changed (keyboard required)
         if leds_dirty and kb:
@@ -787,14 +1308,10 @@ def main():
 
         # 6. Animate pulse for "your_turn" LEDs (keyboard required)
         if kb and mgr.any_your_turn():
-            stale_ids = {s.session_id for s in mgr.get_dimmed()}
-            t = now % PULSE_PERIOD
-            pulse = (math.sin(t / PULSE_PERIOD * 2 * math.pi - math.pi / 2) + 1) / 2
-            v = int(DIM_V + (ORANGE_V - DIM_V) * pulse)
-            v = v // PULSE_QUANT * PULSE_QUANT
+            v = PULSE_LUT[int(now % PULSE_PERIOD / PULSE_PERIOD * 256) & 0xFF]
 
             for sess in mgr.sessions.values():
-                if sess.state != "your_turn" or sess.session_id in stale_ids:
+                if sess.state != STATE_YOUR_TURN or now >= sess.dim_at:
                     continue
                 led = SLOT_LEDS[sess.slot]
                 if last_pulse_v.get(led) != v:
@@ -803,22 +1320,66 @@ def main():
 
         # 7. Animate breathing for "working" LEDs (keyboard required)
         if kb:
-            has_working = any(s.state == "working" for s in mgr.sessions.values())
-            if has_working:
-                stale_ids = {s.session_id for s in mgr.get_dimmed()}
-                t = now % BREATHE_PERIOD
-                breathe = (math.sin(t / BREATHE_PERIOD * 2 * math.pi - math.pi / 2) + 1) / 2
-                bv = int(BREATHE_MIN_V + (BREATHE_MAX_V - BREATHE_MIN_V) * breathe)
-                bv = bv // PULSE_QUANT * PULSE_QUANT
+            if mgr.any_working():
+                bv = BREATHE_LUT[int(now % BREATHE_PERIOD / BREATHE_PERIOD * 256) & 0xFF]
                 for sess in mgr.sessions.values():
-                    if sess.state != "working" or sess.session_id in stale_ids:
+                    if sess.state != STATE_WORKING or now >= sess.dim_at:
                         continue
                     led = SLOT_LEDS[sess.slot]
                     if last_pulse_v.get(led) != bv:
                         kb.set_led(led, ORANGE_H, ORANGE_S, bv)
                         last_pulse_v[led] = bv
 
-        time.sleep(0.05)
+        flush_log()
+
+        # 8. Sleep until the next tick. Ticks sit on a fixed TICK grid so the
+        # animations don't drift; ticks missed by a late wakeup are skipped
+        # rather than replayed. With nothing to animate we block until the
+        # next periodic job instead: watchfiles wakes us on new events, and
+        # through hidd the socket wakes us on key presses. Without a running watcher
+        # the event file is polled, less often the longer it stays quiet.
+        now = time.monotonic()
+        if now >= next_tick:
+            next_tick += TICK * (int((now - next_tick) / TICK) + 1)
+        if kb and mgr.any_animating(now):
+            wake_at = next_tick
+        else:
+            if kb:
+                wake_at = last_heartbeat + HEARTBEAT_INTERVAL
+            else:
+                wake_at = last_connect_attempt + RECONNECT_INTERVAL
+            if not watching.is_set():
+                wake_at = min(wake_at, now + min(TICK * 2 ** min(idle_polls, 4), IDLE_POLL_MAX))
+        expiry = mgr.next_expiry()
+        if expiry is not None:
+            wake_at = min(wake_at, expiry)  # wake to release a stale session
+        timeout = wake_at - now
+        wait_fds = [wake_r]
+        kb_fd = kb.fileno() if kb else None
+        if kb_fd is not None:
+            wait_fds.append(kb_fd)
+        if not stop.is_set():
+            select.select(wait_fds, [], [], max(0, timeout))
+        try:
+            os.read(wake_r, 4096)
+        except BlockingIOError:
+            pass
+
+    if kb:
+        try:
+            kb.enter_direct_mode()
+            if kb.shared:
+                for led in SLOT_LEDS:
+                    kb.set_led(led, 0, 0, 0)
+            else:
+                kb.set_all_leds(0, 0, 0)
+            kb.set_underglow(0, 0, 0)
+            kb.close()
+        except Exception:
+            pass
+    tail.close()
+    flush_log()
+    print("\nBye.")
 
 
 if __name__ == "__main__":